@@ -20,76 +20,228 @@ These endpoints call other services for EACH item in a collection:
 - GET /favourite-service/api/favourites → calls UserService + ProductService N times
 
 
+Transport:
+----------
+Users run on FastHttpUser (geventhttpclient) with per-user HTTP/1.1 keep-alive
+pools. HTTP/2 is not used: the API Gateway is served over cleartext http:// with
+HTTP/2 disabled, so an h2-capable client (e.g. httpx) would fall back to
+HTTP/1.1 anyway. Revisit if the gateway enables `server.http2.enabled` + TLS.
+
+
 Configuration:
 --------------
 See locust.conf for default parameters.
+
+Environment variables:
+- N1_MAX_IN_FLIGHT: max concurrent requests per N+1 endpoint per worker (default 64)
+- BATCH_FETCH_WEIGHT: task weight of each [BATCH] task (default 0 = disabled)
+
+Extra command line options:
+- --hosts: comma-separated gateway base URLs (env LOCUST_HOSTS). Each user
+  pins one at random, spreading connections past per-host limits. The first
+  one is used as the host when --host is not given.
 """
 
+import collections
+import heapq
+import itertools
+import os
 import random
+import sys
 import time
-from datetime import datetime
-from locust import HttpUser, task, between
+import gevent
+import orjson
+from gevent.lock import BoundedSemaphore
+from locust import between
+from locust.contrib.fasthttp import FastHttpUser
+
+
+# ============================================================================
+# ENDPOINTS - URLs and stat names, bound once at import
+# ============================================================================
+
+URL_CARTS = "/order-service/api/carts"
+URL_PAYMENTS = "/payment-service/api/payments"
+URL_SHIPPINGS = "/shipping-service/api/shippings"
+URL_FAVOURITES = "/favourite-service/api/favourites"
+URL_USERS = "/user-service/api/users"
+URL_PRODUCTS = "/product-service/api/products"
+URL_ORDERS = "/order-service/api/orders"
+URL_CATEGORIES = "/product-service/api/categories"
+
+NAME_CARTS = "[N+1] GET All Carts (calls UserService per cart)"
+NAME_PAYMENTS = "[N+1 NESTED] GET All Payments (calls Order-Cart-User)"
+NAME_SHIPPINGS = "[N+1 DUAL] GET All Shippings (calls Product+Order per item)"
+NAME_FAVOURITES = "[N+1 DUAL] GET All Favourites (calls User+Product per fav)"
+NAME_USERS = "[BASELINE] GET All Users (no N+1)"
+NAME_PRODUCTS = "[BASELINE] GET All Products (no N+1)"
+NAME_ORDERS = "[POTENTIAL N+1] GET All Orders (calls Cart per order)"
+NAME_CATEGORIES = "[BASELINE] GET All Categories (no N+1)"
+# Stat names for 304 Not Modified responses of the conditional GETs
+NOT_MODIFIED_NAMES = {
+    name: f"{name} (304)"
+    for name in (
+        NAME_CARTS, NAME_PAYMENTS, NAME_SHIPPINGS, NAME_FAVOURITES, NAME_ORDERS,
+        NAME_USERS, NAME_PRODUCTS, NAME_CATEGORIES,
+    )
+}
+
+# Batch-fetch contract (GET <collection>/batch?ids=...): one hop instead of N.
+# Not implemented by the services yet, so these tasks are off unless
+# BATCH_FETCH_WEIGHT is set; once enabled, on_test_stop reports the speedup.
+BATCH_IDS = ",".join(str(i) for i in range(1, 51))
+URL_CARTS_BATCH = f"{URL_CARTS}/batch?ids={BATCH_IDS}"
+URL_PAYMENTS_BATCH = f"{URL_PAYMENTS}/batch?ids={BATCH_IDS}"
+URL_SHIPPINGS_BATCH = f"{URL_SHIPPINGS}/batch?ids={BATCH_IDS}"
+URL_FAVOURITES_BATCH = f"{URL_FAVOURITES}/batch?ids={BATCH_IDS}"
+NAME_CARTS_BATCH = "[BATCH] GET Carts batched"
+NAME_PAYMENTS_BATCH = "[BATCH] GET Payments batched"
+NAME_SHIPPINGS_BATCH = "[BATCH] GET Shippings batched"
+NAME_FAVOURITES_BATCH = "[BATCH] GET Favourites batched"
+BATCH_TASK_WEIGHT = int(os.environ.get("BATCH_FETCH_WEIGHT", 0))
+
+NAME_CREATE_USER = "[CREATE] POST User"
+NAME_CREATE_CATEGORY = "[CREATE] POST Category"
+NAME_CREATE_PRODUCT = "[CREATE] POST Product"
+NAME_CREATE_CART = "[CREATE] POST Cart"
 
 
 # ============================================================================
 # HELPER FUNCTIONS
 # ============================================================================
 
+_json_loads = orjson.loads
+
+
 def get_error_message(response):
     """Extract error message from response (API Gateway or ExceptionMsg format)"""
+    content = response.content
+    if not content:
+        return ''
     try:
-        error_data = response.json()
-        if 'msg' in error_data:
-            return error_data['msg']
-        error_msg = error_data.get('error', 'Unknown error')
-        if 'message' in error_data:
-            error_msg += f": {error_data['message']}"
-        return error_msg
-    except:
-        return response.text[:200]
+        error_data = _json_loads(content)
+    except ValueError:
+        error_data = None
+    if not isinstance(error_data, dict):
+        # Decode the raw bytes directly: response.text may sniff the charset
+        return content[:200].decode('utf-8', 'replace')
+    msg = error_data.get('msg')
+    if msg:
+        return msg
+    error_msg = error_data.get('error', 'Unknown error')
+    message = error_data.get('message')
+    return f"{error_msg}: {message}" if message else error_msg
+
+
+# Slow-response thresholds (ms), warning labels and item units, keyed by stat
+# name. Checked in the request event listener, off the task code path.
+SLOW_RESPONSES = {
+    NAME_CARTS: (2000, "WARNING SLOW N+1: GET /carts", "carts"),
+    NAME_PAYMENTS: (3000, "WARNING SLOW NESTED N+1: GET /payments", "payments"),
+    NAME_SHIPPINGS: (3000, "WARNING SLOW DUAL N+1: GET /shippings", "items"),
+    NAME_FAVOURITES: (2500, "WARNING SLOW DUAL N+1: GET /favourites", "favs"),
+    NAME_ORDERS: (2000, "WARNING SLOW: GET /orders", "orders"),
+}
+# Same thresholds for the 304s: with a shallow ETag the server still runs the
+# whole N+1 join to hash the body, so a 304 can be just as slow. No unit, as
+# there is no body to count items in.
+SLOW_RESPONSES.update({
+    NOT_MODIFIED_NAMES[name]: (threshold_ms, f"{label} (304)", None)
+    for name, (threshold_ms, label, _) in SLOW_RESPONSES.items()
+})
+
+# Slow responses are tallied per endpoint by the request listener and written
+# as one summary per interval by a single background greenlet, so print() never
+# blocks a request and a stalled endpoint can't flood stdout. Greenlets only
+# switch on I/O, so the tallies need no lock.
+_slow_counts = collections.Counter()
+_slow_worst = {}  # name -> (elapsed_s, item count) of the slowest response
+_warn_drainer = None
+
+
+def _flush_warnings():
+    """Write the slow-response tallies since the last flush with a single stdout write"""
+    if not _slow_counts:
+        return
+    lines = []
+    for name, hits in _slow_counts.items():
+        _, label, unit = SLOW_RESPONSES[name]
+        elapsed, count = _slow_worst.get(name, (0.0, "?"))
+        detail = f"for {count} {unit}" if unit else "with no body"
+        lines.append(f"{label} slow x{hits}, worst {elapsed:.2f}s {detail}\n")
+    _slow_counts.clear()
+    _slow_worst.clear()
+    sys.stdout.write("".join(lines))
+    sys.stdout.flush()
+
+
+def _drain_warnings():
+    """Background loop flushing slow-response tallies every second"""
+    while True:
+        gevent.sleep(1.0)
+        _flush_warnings()
+
+
+# Per-endpoint cap on in-flight requests for the four N+1 endpoints. This turns
+# the workload from "unbounded in-flight" into "bounded in-flight per endpoint"
+# (what real clients with sized pools do), so one stalling endpoint can't absorb
+# every greenlet and starve the others of samples. Resized on test start from
+# the N1_MAX_IN_FLIGHT env var.
+N1_ENDPOINTS = ("carts", "payments", "shippings", "favourites")
+N1_MAX_IN_FLIGHT_DEFAULT = 64
+_n1_slots = {key: BoundedSemaphore(N1_MAX_IN_FLIGHT_DEFAULT) for key in N1_ENDPOINTS}
+
+
+# Headers for pre-encoded JSON bodies (sent with data= instead of json=). Also
+# carries every key FastHttpSession would otherwise add, so the shared dict is
+# never mutated per request.
+JSON_HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "Accept-Encoding": "gzip, deflate, br",
+}
+
+# Cart payload never changes: encode it once
+CART_BODY = orjson.dumps({"userId": 1})  # Assumes user 1 exists
+
+# Pre-encoded JSON templates for the CREATE payloads. Only numeric fields are
+# interpolated (bytes %-formatting), so no escaping or encoder run is needed.
+USER_BODY = (
+    b'{"firstName":"Load%d","lastName":"Test","email":"load_%d@test.com",'
+    b'"phone":"+12%09d","imageUrl":"https://via.placeholder.com/150"}'
+)
+CATEGORY_BODY = b'{"categoryTitle":"LoadTest_%d","imageUrl":"https://via.placeholder.com/300"}'
+PRODUCT_BODY = (
+    b'{"productTitle":"LoadTest Product %d","imageUrl":"https://via.placeholder.com/400",'
+    b'"sku":"SKU-%d","priceUnit":%d.%02d,"quantity":%d,"category":{"categoryId":1}}'
+)
+
+
+# Dedicated RNG for payload fields, with its draw methods pre-bound
+_RNG = random.Random()
+_randint = _RNG.randint
+
+# Gateway base URLs from --hosts, filled on test start (empty = use --host)
+GATEWAY_HOSTS = []
+
+# Lock-free unique suffix source (next() on itertools.count is atomic under the GIL)
+_next_id = itertools.count(1).__next__
 
 
 class TestDataGenerator:
     """Generates unique test data for concurrent request creation"""
     
-    _counter = 0
-    
-    @classmethod
-    def get_timestamp(cls):
+    @staticmethod
+    def get_timestamp():
         """Get unique timestamp"""
-        cls._counter += 1
-        return int(time.time() * 1000) + cls._counter
-    
-    @classmethod
-    def get_unique_email(cls):
-        """Generate unique email for user creation"""
-        ts = cls.get_timestamp()
-        return f"load_{ts}@test.com"
-    
-    @classmethod
-    def get_unique_username(cls):
-        """Generate unique username for credential creation"""
-        ts = cls.get_timestamp()
-        return f"user_{ts}"
-    
-    @classmethod
-    def get_unique_sku(cls):
-        """Generate unique SKU for product creation"""
-        ts = cls.get_timestamp()
-        return f"SKU-{ts}"
-    
-    @classmethod
-    def get_datetime_formatted(cls):
-        """Get current datetime in dd-MM-yyyy__HH:mm:ss:SSSSSS format"""
-        now = datetime.now()
-        return now.strftime("%d-%m-%Y__%H:%M:%S:") + str(now.microsecond).zfill(6)
+        return time.time_ns() // 1_000_000 + _next_id()
 
 
 # ============================================================================
 # MAIN USER CLASS - All tasks are independent and concurrent
 # ============================================================================
 
-class MicroserviceStressUser(HttpUser):
+class MicroserviceStressUser(FastHttpUser):
     """
     High-concurrency stress testing user.
     
@@ -101,12 +253,54 @@ class MicroserviceStressUser(HttpUser):
     
     wait_time = between(0.1, 0.5)  # Very short wait = maximum concurrency
     
+    # FastHttpUser (geventhttpclient) instead of HttpUser (python-requests):
+    # far less CPU per request, so one worker can actually saturate the N+1
+    # endpoints. Each user also keeps an HTTP/1.1 keep-alive pool, reusing
+    # sockets across all tasks instead of reconnecting.
+    
+    # Twice FastHttpUser's 60s default: a very slow N+1 join should land in the
+    # stats as a latency sample, not as a timeout failure
+    network_timeout = 120.0
+    connection_timeout = 10.0  # a connect that takes longer is a failure in itself
+    max_retries = 0  # retries would hide failures from the stats
+    default_headers = {"Accept": "application/json"}
+    
+    def on_start(self):
+        """Initialize per-user state"""
+        self._etags = {}  # url -> last ETag seen by this user
+        # Bound once so tasks skip the self.client attribute chain per request
+        self._get = self.client.get
+        self._post = self.client.post
+        if GATEWAY_HOSTS:
+            self.client.base_url = _RNG.choice(GATEWAY_HOSTS)
+    
+    def _conditional_get(self, url, name):
+        """
+        GET that sends If-None-Match from this user's last ETag for url.
+        200 and 304 are successes; a 304 is recorded under a separate
+        "<name> (304)" stat entry, so a server-side cache shows up as its own
+        time series instead of being averaged into the full responses. Any
+        other status is a failure.
+        """
+        etag = self._etags.get(url)
+        headers = {"If-None-Match": etag} if etag else None
+        with self._get(url, catch_response=True, name=name, headers=headers) as response:
+            if response.status_code == 200:
+                new_etag = response.headers.get("ETag")
+                if new_etag:
+                    self._etags[url] = new_etag
+                response.success()
+            elif response.status_code == 304:
+                response.request_meta["name"] = NOT_MODIFIED_NAMES[name]
+                response.success()
+            else:
+                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+    
     
     # ========================================================================
     # CRITICAL: N+1 PROBLEM ENDPOINTS (Highest Priority)
     # ========================================================================
     
-    @task(50)  # HIGHEST WEIGHT - Most critical N+1 problem
     def get_all_carts_with_users(self):
         """
         N+1 PROBLEM: CartService calls UserService for EACH cart.
@@ -117,23 +311,10 @@ class MicroserviceStressUser(HttpUser):
         With 100 carts = 100+ HTTP calls to UserService!
         Under high concurrency, this becomes exponentially worse.
         """
-        with self.client.get(
-            "/order-service/api/carts",
-            catch_response=True,
-            name="[N+1] GET All Carts (calls UserService per cart)"
-        ) as response:
-            if response.status_code == 200:
-                data = response.json()
-                carts = data.get('collection', [])
-                # Log performance warning if response is slow
-                if response.elapsed.total_seconds() > 2.0:
-                    print(f"WARNING SLOW N+1: GET /carts took {response.elapsed.total_seconds():.2f}s for {len(carts)} carts")
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        with _n1_slots["carts"]:
+            self._conditional_get(URL_CARTS, NAME_CARTS)
     
     
-    @task(40)  # VERY HIGH WEIGHT - Nested N+1 problem
     def get_all_payments_with_orders(self):
         """
         N+1 PROBLEM: PaymentService calls OrderService for EACH payment.
@@ -144,22 +325,10 @@ class MicroserviceStressUser(HttpUser):
         
         With 50 payments, this can trigger 150+ inter-service HTTP calls.
         """
-        with self.client.get(
-            "/payment-service/api/payments",
-            catch_response=True,
-            name="[N+1 NESTED] GET All Payments (calls Order-Cart-User)"
-        ) as response:
-            if response.status_code == 200:
-                data = response.json()
-                payments = data.get('collection', [])
-                if response.elapsed.total_seconds() > 3.0:
-                    print(f"WARNING SLOW NESTED N+1: GET /payments took {response.elapsed.total_seconds():.2f}s for {len(payments)} payments")
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        with _n1_slots["payments"]:
+            self._conditional_get(URL_PAYMENTS, NAME_PAYMENTS)
     
     
-    @task(35)  # HIGH WEIGHT - Dual N+1 problem
     def get_all_shippings_with_products_and_orders(self):
         """
         DUAL N+1 PROBLEM: ShippingService calls both ProductService AND OrderService.
@@ -170,22 +339,10 @@ class MicroserviceStressUser(HttpUser):
         
         For EACH shipping item! With 200 items = 400 HTTP calls.
         """
-        with self.client.get(
-            "/shipping-service/api/shippings",
-            catch_response=True,
-            name="[N+1 DUAL] GET All Shippings (calls Product+Order per item)"
-        ) as response:
-            if response.status_code == 200:
-                data = response.json()
-                shippings = data.get('collection', [])
-                if response.elapsed.total_seconds() > 3.0:
-                    print(f"WARNING SLOW DUAL N+1: GET /shippings took {response.elapsed.total_seconds():.2f}s for {len(shippings)} items")
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        with _n1_slots["shippings"]:
+            self._conditional_get(URL_SHIPPINGS, NAME_SHIPPINGS)
     
     
-    @task(30)  # HIGH WEIGHT - Dual N+1 problem
     def get_all_favourites_with_users_and_products(self):
         """
         DUAL N+1 PROBLEM: FavouriteService calls UserService AND ProductService.
@@ -193,86 +350,62 @@ class MicroserviceStressUser(HttpUser):
         FavouriteServiceImpl.findAll() calls both services for EACH favourite.
         With 300 favourites = 600 HTTP calls.
         """
-        with self.client.get(
-            "/favourite-service/api/favourites",
-            catch_response=True,
-            name="[N+1 DUAL] GET All Favourites (calls User+Product per fav)"
-        ) as response:
-            if response.status_code == 200:
-                data = response.json()
-                favourites = data.get('collection', [])
-                if response.elapsed.total_seconds() > 2.5:
-                    print(f"WARNING SLOW DUAL N+1: GET /favourites took {response.elapsed.total_seconds():.2f}s for {len(favourites)} favs")
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        with _n1_slots["favourites"]:
+            self._conditional_get(URL_FAVOURITES, NAME_FAVOURITES)
     
     
     # ========================================================================
     # BASELINE: Simple GET Collections (No N+1 problem)
+    # Conditional GETs like the N+1 tasks, so both sides of the comparison
+    # see the same 200/304 mix
     # ========================================================================
     
-    @task(20)
     def get_all_users(self):
         """Baseline: Simple query, no inter-service calls"""
-        with self.client.get(
-            "/user-service/api/users",
-            catch_response=True,
-            name="[BASELINE] GET All Users (no N+1)"
-        ) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        self._conditional_get(URL_USERS, NAME_USERS)
     
     
-    @task(20)
     def get_all_products(self):
         """Baseline: Simple query, no inter-service calls"""
-        with self.client.get(
-            "/product-service/api/products",
-            catch_response=True,
-            name="[BASELINE] GET All Products (no N+1)"
-        ) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        self._conditional_get(URL_PRODUCTS, NAME_PRODUCTS)
     
     
-    @task(15)
     def get_all_orders(self):
         """
         Potential N+1: OrderService may populate cartDto via RestTemplate.
         Less severe than others but still worth monitoring.
         """
-        with self.client.get(
-            "/order-service/api/orders",
-            catch_response=True,
-            name="[POTENTIAL N+1] GET All Orders (calls Cart per order)"
-        ) as response:
-            if response.status_code == 200:
-                data = response.json()
-                orders = data.get('collection', [])
-                if response.elapsed.total_seconds() > 2.0:
-                    print(f"WARNING SLOW: GET /orders took {response.elapsed.total_seconds():.2f}s for {len(orders)} orders")
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        self._conditional_get(URL_ORDERS, NAME_ORDERS)
     
     
-    @task(10)
     def get_all_categories(self):
         """Baseline: Simple query, no inter-service calls"""
-        with self.client.get(
-            "/product-service/api/categories",
-            catch_response=True,
-            name="[BASELINE] GET All Categories (no N+1)"
-        ) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
+        self._conditional_get(URL_CATEGORIES, NAME_CATEGORIES)
+    
+    
+    # ========================================================================
+    # BATCH FETCH: Same collections via a single batch call (fixed N+1)
+    # Weight 0 (not registered) unless BATCH_FETCH_WEIGHT is set
+    # ========================================================================
+    
+    def get_carts_batched(self):
+        """Batch counterpart of get_all_carts_with_users"""
+        self._get(URL_CARTS_BATCH, name=NAME_CARTS_BATCH)
+    
+    
+    def get_payments_batched(self):
+        """Batch counterpart of get_all_payments_with_orders"""
+        self._get(URL_PAYMENTS_BATCH, name=NAME_PAYMENTS_BATCH)
+    
+    
+    def get_shippings_batched(self):
+        """Batch counterpart of get_all_shippings_with_products_and_orders"""
+        self._get(URL_SHIPPINGS_BATCH, name=NAME_SHIPPINGS_BATCH)
+    
+    
+    def get_favourites_batched(self):
+        """Batch counterpart of get_all_favourites_with_users_and_products"""
+        self._get(URL_FAVOURITES_BATCH, name=NAME_FAVOURITES_BATCH)
     
     
     # ========================================================================
@@ -280,25 +413,21 @@ class MicroserviceStressUser(HttpUser):
     # For: User, Category, Product, Cart (baseline write operations)
     # ========================================================================
     
-    @task(5)
     def create_user(self):
         """
         Create user with embedded credential.
         Tests: User creation + Credential creation in single transaction.
         """
-        user_data = {
-            "firstName": f"Load{TestDataGenerator.get_timestamp()}",
-            "lastName": "Test",
-            "email": TestDataGenerator.get_unique_email(),
-            "phone": f"+1{random.randint(2000000000, 2999999999)}",
-            "imageUrl": "https://via.placeholder.com/150"
-        }
+        # One unique id per user: name, email and phone all derive from it
+        uid = TestDataGenerator.get_timestamp()
+        body = USER_BODY % (uid, uid, uid % 1_000_000_000)
         
-        with self.client.post(
-            "/user-service/api/users",
-            json=user_data,
+        with self._post(
+            URL_USERS,
+            data=body,
+            headers=JSON_HEADERS,
             catch_response=True,
-            name="[CREATE] POST User"
+            name=NAME_CREATE_USER
         ) as response:
             if response.status_code in [200, 201]:
                 response.success()
@@ -306,19 +435,16 @@ class MicroserviceStressUser(HttpUser):
                 response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
     
     
-    @task(3)
     def create_category(self):
         """Create product category - simple write operation"""
-        category_data = {
-            "categoryTitle": f"LoadTest_{TestDataGenerator.get_timestamp()}",
-            "imageUrl": "https://via.placeholder.com/300"
-        }
+        body = CATEGORY_BODY % TestDataGenerator.get_timestamp()
         
-        with self.client.post(
-            "/product-service/api/categories",
-            json=category_data,
+        with self._post(
+            URL_CATEGORIES,
+            data=body,
+            headers=JSON_HEADERS,
             catch_response=True,
-            name="[CREATE] POST Category"
+            name=NAME_CREATE_CATEGORY
         ) as response:
             if response.status_code in [200, 201]:
                 response.success()
@@ -326,28 +452,27 @@ class MicroserviceStressUser(HttpUser):
                 response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
     
     
-    @task(4)
     def create_product(self):
         """
         Create product - requires existing category.
         Uses categoryId=1 (assumes it exists - idempotent for read operations).
         """
-        product_data = {
-            "productTitle": f"LoadTest Product {TestDataGenerator.get_timestamp()}",
-            "imageUrl": "https://via.placeholder.com/400",
-            "sku": TestDataGenerator.get_unique_sku(),
-            "priceUnit": round(random.uniform(10.0, 500.0), 2),
-            "quantity": random.randint(10, 1000),
-            "category": {
-                "categoryId": 1
-            }
-        }
+        uid = TestDataGenerator.get_timestamp()
+        price_cents = _randint(1000, 50000)  # 10.00 - 500.00, no float rounding
+        body = PRODUCT_BODY % (
+            uid,
+            uid,
+            price_cents // 100,
+            price_cents % 100,
+            _randint(10, 1000),
+        )
         
-        with self.client.post(
-            "/product-service/api/products",
-            json=product_data,
+        with self._post(
+            URL_PRODUCTS,
+            data=body,
+            headers=JSON_HEADERS,
             catch_response=True,
-            name="[CREATE] POST Product"
+            name=NAME_CREATE_PRODUCT
         ) as response:
             if response.status_code in [200, 201]:
                 response.success()
@@ -355,21 +480,17 @@ class MicroserviceStressUser(HttpUser):
                 response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
     
     
-    @task(3)
     def create_cart(self):
         """
         Create cart - requires existing user.
         Uses userId=1 (assumes it exists).
         """
-        cart_data = {
-            "userId": 1  # Assumes user 1 exists
-        }
-        
-        with self.client.post(
-            "/order-service/api/carts",
-            json=cart_data,
+        with self._post(
+            URL_CARTS,
+            data=CART_BODY,
+            headers=JSON_HEADERS,
             catch_response=True,
-            name="[CREATE] POST Cart"
+            name=NAME_CREATE_CART
         ) as response:
             if response.status_code in [200, 201]:
                 response.success()
@@ -378,6 +499,30 @@ class MicroserviceStressUser(HttpUser):
             else:
                 response.failure(f"Failed [{response.status_code}]: {get_error_message(response)}")
     
+    
+    # ========================================================================
+    # TASK WEIGHTS - one table, expanded by Locust once at class creation
+    # ========================================================================
+    
+    tasks = {
+        get_all_carts_with_users: 50,  # HIGHEST WEIGHT - Most critical N+1 problem
+        get_all_payments_with_orders: 40,  # VERY HIGH WEIGHT - Nested N+1 problem
+        get_all_shippings_with_products_and_orders: 35,  # HIGH WEIGHT - Dual N+1 problem
+        get_all_favourites_with_users_and_products: 30,  # HIGH WEIGHT - Dual N+1 problem
+        get_all_users: 20,
+        get_all_products: 20,
+        get_all_orders: 15,
+        get_all_categories: 10,
+        get_carts_batched: BATCH_TASK_WEIGHT,
+        get_payments_batched: BATCH_TASK_WEIGHT,
+        get_shippings_batched: BATCH_TASK_WEIGHT,
+        get_favourites_batched: BATCH_TASK_WEIGHT,
+        create_user: 5,
+        create_category: 3,
+        create_product: 4,
+        create_cart: 3,
+    }
+
 
 # ============================================================================
 # EVENT LISTENERS - Performance monitoring and reporting
@@ -385,13 +530,64 @@ class MicroserviceStressUser(HttpUser):
 
 from locust import events
 
+@events.init_command_line_parser.add_listener
+def on_init_parser(parser, **kwargs):
+    """Register extra command line options"""
+    parser.add_argument(
+        "--hosts",
+        type=str,
+        env_var="LOCUST_HOSTS",
+        default="",
+        help="Comma-separated gateway base URLs; each user picks one (overrides --host, "
+             "and the first one stands in for it when --host is not set)"
+    )
+
+
+@events.request.add_listener
+def on_request(name, response_time, response, exception, **kwargs):
+    """Tally slow successful responses on watched endpoints"""
+    slow = SLOW_RESPONSES.get(name)
+    if slow is None or exception is not None:
+        return
+    if response_time <= slow[0]:
+        return
+    elapsed = response_time / 1000
+    worst = _slow_worst.get(name)
+    if worst is None or elapsed > worst[0]:
+        count = None
+        if slow[2] is not None:
+            # Only parse the (large) joined collection for the worst response
+            try:
+                data = orjson.loads(response.content)
+                count = len(data.get('collection', [])) if isinstance(data, dict) else "?"
+            except (TypeError, ValueError):
+                count = "?"
+        _slow_worst[name] = (elapsed, count)
+    # Counted only once the worst record exists, so a flush always finds one
+    _slow_counts[name] += 1
+
+
 @events.test_start.add_listener
 def on_test_start(environment, **kwargs):
     """Print test configuration on start"""
+    global _warn_drainer
+    _warn_drainer = gevent.spawn(_drain_warnings)
+    
+    n1_limit = int(os.environ.get("N1_MAX_IN_FLIGHT", N1_MAX_IN_FLIGHT_DEFAULT))
+    _n1_slots.update({key: BoundedSemaphore(n1_limit) for key in N1_ENDPOINTS})
+    
+    hosts = getattr(environment.parsed_options, "hosts", "") or ""
+    GATEWAY_HOSTS[:] = [h.strip().rstrip("/") for h in hosts.split(",") if h.strip()]
+    if GATEWAY_HOSTS and not environment.host:
+        # FastHttpUser refuses to start without a host; the runner copies this
+        # onto the user classes right after test_start
+        environment.host = GATEWAY_HOSTS[0]
+    
     print("=" * 80)
     print("HIGH CONCURRENCY & N+1 PERFORMANCE TEST")
     print("=" * 80)
-    print(f"Target: {environment.host}")
+    print(f"Target: {', '.join(GATEWAY_HOSTS) or environment.host}")
+    print(f"N+1 in-flight limit per endpoint: {n1_limit}")
     print("=" * 80)
     print("Test Focus:")
     print("  * N+1 Problem Detection (CartService, PaymentService, ShippingService, FavouriteService)")
@@ -402,9 +598,36 @@ def on_test_start(environment, **kwargs):
     print("=" * 80)
 
 
+REPORT_PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def _response_time_percentiles(stat, percents=REPORT_PERCENTILES):
+    """
+    Several response-time percentiles from one sorted pass over the stat's
+    {rounded ms: count} histogram, with the same semantics as
+    StatsEntry.get_response_time_percentile (which sorts once per call).
+    """
+    result = dict.fromkeys(percents, 0)
+    pending = sorted(percents, reverse=True)
+    num_requests = stat.num_requests
+    processed = 0
+    # Walking from the slowest bucket down, higher percentiles resolve first
+    for response_time in sorted(stat.response_times, reverse=True):
+        processed += stat.response_times[response_time]
+        while pending and num_requests - processed <= int(num_requests * pending[0]):
+            result[pending.pop(0)] = response_time
+        if not pending:
+            break
+    return result
+
+
 @events.test_stop.add_listener
 def on_test_stop(environment, **kwargs):
     """Print performance summary on stop"""
+    if _warn_drainer is not None:
+        _warn_drainer.kill()
+    _flush_warnings()
+    
     print("\n" + "=" * 80)
     print("PERFORMANCE TEST RESULTS")
     print("=" * 80)
@@ -421,41 +644,73 @@ def on_test_stop(environment, **kwargs):
     print("\nSLOWEST ENDPOINTS (Potential N+1 Problems):")
     print("-" * 80)
     
-    sorted_stats = sorted(
-        [s for s in environment.stats.entries.values() if s.num_requests > 0],
-        key=lambda x: x.avg_response_time,
-        reverse=True
-    )[:10]
+    n1_endpoints = [NAME_CARTS, NAME_PAYMENTS, NAME_SHIPPINGS, NAME_FAVOURITES]
+    batch_endpoints = [NAME_CARTS_BATCH, NAME_PAYMENTS_BATCH, NAME_SHIPPINGS_BATCH, NAME_FAVOURITES_BATCH]
     
-    for stat in sorted_stats:
-        print(f"{stat.name:60s} | Avg: {stat.avg_response_time:8.2f}ms | Max: {stat.max_response_time:8.2f}ms")
+    # Single pass over the stats feeding both reports: averages for the top-10
+    # (avg_response_time is a computed property, so evaluate it once per entry)
+    # and the known N+1/batch endpoints plus the N+1 "<name> (304)" entries, by
+    # exact name so the 304s don't shadow the full responses
+    n1_not_modified = [NOT_MODIFIED_NAMES[name] for name in n1_endpoints]
+    keyed = []
+    by_name = dict.fromkeys(n1_endpoints + n1_not_modified + batch_endpoints)
+    for s in environment.stats.entries.values():
+        if s.num_requests > 0:
+            keyed.append((s.total_response_time / s.num_requests, s))
+        if s.name in by_name and by_name[s.name] is None:
+            by_name[s.name] = s
     
-    print("=" * 80)
+    slowest = heapq.nlargest(10, keyed, key=lambda kv: kv[0])
     
-    # N+1 specific analysis
-    n1_endpoints = [
-        "[N+1] GET All Carts",
-        "[N+1 NESTED] GET All Payments",
-        "[N+1 DUAL] GET All Shippings",
-        "[N+1 DUAL] GET All Favourites"
-    ]
+    for avg, stat in slowest:
+        print(f"{stat.name:60s} | Avg: {avg:8.2f}ms | Max: {stat.max_response_time:8.2f}ms")
+    
+    print("=" * 80)
     
     print("\nN+1 PROBLEM ANALYSIS:")
     print("-" * 80)
     
     for endpoint_name in n1_endpoints:
-        matching_stats = [s for s in environment.stats.entries.values() if endpoint_name in s.name]
-        if matching_stats:
-            stat = matching_stats[0]
+        stat = by_name[endpoint_name]
+        if stat is not None:
+            avg = stat.avg_response_time
+            pct = _response_time_percentiles(stat)
             print(f"{stat.name:60s}")
             print(f"  Requests: {stat.num_requests:,} | Failures: {stat.num_failures:,}")
-            print(f"  Avg: {stat.avg_response_time:.2f}ms | P95: {stat.get_response_time_percentile(0.95):.2f}ms | Max: {stat.max_response_time:.2f}ms")
+            print(f"  Avg: {avg:.2f}ms | P50: {pct[0.5]:.2f}ms | P95: {pct[0.95]:.2f}ms | "
+                  f"P99: {pct[0.99]:.2f}ms | Max: {stat.max_response_time:.2f}ms")
+            
+            # 304s still pay the N+1 cost when the ETag is computed from the body
+            not_modified = by_name[NOT_MODIFIED_NAMES[endpoint_name]]
+            if not_modified is not None:
+                nm_pct = _response_time_percentiles(not_modified)
+                print(f"  304 Not Modified: {not_modified.num_requests:,} | "
+                      f"Avg: {not_modified.avg_response_time:.2f}ms | P95: {nm_pct[0.95]:.2f}ms | "
+                      f"Max: {not_modified.max_response_time:.2f}ms")
             
             # Performance warning
-            if stat.avg_response_time > 1000:
+            if avg > 1000:
                 print(f"  WARNING CRITICAL: Avg response time > 1s - SEVERE N+1 PROBLEM!")
-            elif stat.avg_response_time > 500:
+            elif avg > 500:
                 print(f"  WARNING: Avg response time > 500ms - N+1 problem detected")
             else:
                 print(f"  OK: Performance acceptable")
-            print()
\ No newline at end of file
+            print()
+    
+    # Batch vs N+1 comparison (only when the batch tasks were enabled)
+    pairs = [(by_name[n1], by_name[batch]) for n1, batch in zip(n1_endpoints, batch_endpoints)]
+    pairs = [(n1, batch) for n1, batch in pairs if n1 and batch and n1.num_requests and batch.num_requests]
+    if pairs:
+        print("\nBATCH vs N+1 COMPARISON:")
+        print("-" * 80)
+        for n1, batch in pairs:
+            print(f"{batch.name:60s}")
+            # Fast 404s from a missing /batch endpoint would read as a huge speedup
+            if batch.num_failures == batch.num_requests:
+                print(f"  Skipped: all {batch.num_requests:,} batch requests failed")
+                continue
+            n1_avg = n1.avg_response_time
+            batch_avg = batch.avg_response_time
+            print(f"  N+1 Avg: {n1_avg:.2f}ms | Batch Avg: {batch_avg:.2f}ms | Speedup: {n1_avg / max(batch_avg, 0.001):.1f}x "
+                  f"| Batch Failures: {batch.num_failures:,}/{batch.num_requests:,}")
+        print("=" * 80)